@@ -0,0 +1,35 @@
+# Escrita manualmente (não gerada pelo makemigrations).
+#
+# O campo é adicionado com default=True para que as mensagens já existentes, que
+# foram notificadas pelas execuções anteriores da task, não gerem um novo e-mail;
+# em seguida o default passa a ser False para as mensagens novas.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0003_remove_chatroom_item_description_chatroom_item"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="notified",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name="message",
+            name="notified",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                condition=models.Q(("notified", False)),
+                fields=["room", "sender"],
+                name="chat_message_unnotified_idx",
+            ),
+        ),
+    ]
@@ -35,6 +35,17 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Indica se o destinatário já foi avisado por e-mail sobre esta mensagem.
+    notified = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["room", "sender"],
+                condition=models.Q(notified=False),
+                name="chat_message_unnotified_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.sender.username}: {self.content[:50]}"
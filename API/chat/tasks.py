@@ -1,38 +1,136 @@
+import logging
+from functools import partial
+from smtplib import SMTPException
+
 from celery import shared_task
-from django.core.mail import send_mail
-from django.contrib.auth import get_user_model
-from chat.models import Message, ChatRoom
+from celery.utils.time import get_exponential_backoff_interval
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+
+from chat.models import ChatRoom, Message
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_BATCH_SIZE = 100
+
+# O destinatário de cada mensagem é o participante da sala que não a enviou. As
+# mensagens são agregadas por destinatário antes do join com a tabela de usuários,
+# de modo que apenas os usuários com mensagens não notificadas são consultados.
+PENDING_MESSAGES_SQL = f"""
+    SELECT u.email, pending.message_ids
+    FROM (
+        SELECT
+            CASE
+                WHEN m.sender_id = r.participant_1_id THEN r.participant_2_id
+                ELSE r.participant_1_id
+            END AS recipient_id,
+            ARRAY_AGG(m.id) AS message_ids
+        FROM {Message._meta.db_table} m
+        INNER JOIN {ChatRoom._meta.db_table} r ON r.id = m.room_id
+        WHERE NOT m.notified AND m.sender_id IN (r.participant_1_id, r.participant_2_id)
+        GROUP BY 1
+    ) pending
+    INNER JOIN {User._meta.db_table} u ON u.id = pending.recipient_id
+"""
+
+
+@shared_task(
+    bind=True,
+    rate_limit="1/s",
+    acks_late=True,
+    autoretry_for=(SMTPException, OSError),
+    retry_backoff=True,
+    max_retries=5,
+)
+def send_new_message_notification_emails(self, recipients):
+    """Envia os e-mails de novas mensagens para um lote de pares (email, ids)."""
+    from_email = settings.DEFAULT_FROM_EMAIL
+    failed_recipients = []
+    error = None
+
+    # Reaproveita uma única conexão SMTP para todos os e-mails do lote. Se a conexão
+    # não puder ser aberta, o lote inteiro é reenfileirado pelo autoretry.
+    with get_connection() as smtp_connection:
+        for email, message_ids in recipients:
+            # As mensagens ficam bloqueadas até o envio terminar e só são marcadas
+            # como notificadas se o e-mail sair; linhas já bloqueadas ou notificadas
+            # por outra execução são ignoradas para não duplicar o aviso.
+            with transaction.atomic():
+                pending_ids = list(
+                    Message.objects.select_for_update(skip_locked=True)
+                    .filter(id__in=message_ids, notified=False)
+                    .values_list("id", flat=True)
+                )
+                if not pending_ids:
+                    continue
+
+                new_messages_count = len(pending_ids)
+                subject = f"Você tem novas mensagens ({new_messages_count})"
+                message = (
+                    f"Você tem {new_messages_count} novas mensagens desde o último aviso. "
+                    "Acesse o AcheiUnB para visualizá-las."
+                )
+                recipient_list = [email]
+                try:
+                    EmailMessage(
+                        subject,
+                        message,
+                        from_email,
+                        recipient_list,
+                        connection=smtp_connection,
+                    ).send()
+                except (SMTPException, OSError) as e:
+                    logger.exception("Erro ao enviar e-mail para %s", email)
+                    failed_recipients.append((email, message_ids))
+                    error = e
+                    continue
+
+                Message.objects.filter(id__in=pending_ids).update(notified=True)
+
+    # Apenas os destinatários que falharam são reenviados na nova tentativa, com o
+    # mesmo backoff exponencial usado pelo autoretry.
+    if failed_recipients:
+        countdown = get_exponential_backoff_interval(
+            factor=int(self.retry_backoff),
+            retries=self.request.retries,
+            maximum=self.retry_backoff_max,
+            full_jitter=self.retry_jitter,
+        )
+        raise self.retry(args=(failed_recipients,), exc=error, countdown=countdown)
+
+
 @shared_task
 def send_new_message_notifications():
-    users = User.objects.all()
-
-    for user in users:
-        new_messages_count = 0
-        chatrooms_as_p1 = ChatRoom.objects.filter(participant_1=user)
-        chatrooms_as_p2 = ChatRoom.objects.filter(participant_2=user)
-
-        all_chatrooms = list(set(list(chatrooms_as_p1) + list(chatrooms_as_p2)))
-
-        for chatroom in all_chatrooms:
-            other_participant = None
-            if chatroom.participant_1 == user:
-                other_participant = chatroom.participant_2
-            elif chatroom.participant_2 == user:
-                other_participant = chatroom.participant_1
-
-            if other_participant:
-                new_messages_count += Message.objects.filter(room=chatroom, sender=other_participant).count()
-
-        if new_messages_count > 0:
-            subject = f'Você tem novas mensagens ({new_messages_count})'
-            message = f'Você tem {new_messages_count} novas mensagens não lidas. Acesse o AcheiUnB para visualizá-las.'
-            from_email = settings.DEFAULT_FROM_EMAIL
-            recipient_list = [user.email]
-            try:
-                send_mail(subject, message, from_email, recipient_list)
-            except Exception as e:
-                print(f"Erro ao enviar e-mail para {user.email}: {e}")
+    # Execuções sobrepostas podem enfileirar os mesmos destinatários; a subtask
+    # evita o e-mail duplicado ao bloquear e conferir as mensagens antes do envio.
+    # A transação mantém o cursor do lado do servidor e adia o enfileiramento até
+    # o commit.
+    with transaction.atomic():
+        # Uma única consulta agregada: para cada usuário, reúne as mensagens ainda
+        # não notificadas enviadas pelo outro participante das suas salas. A consulta
+        # é feita em SQL puro para devolver tuplas sem instanciar objetos do ORM, por
+        # um cursor do lado do servidor que traz as linhas em blocos de 2000.
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(PENDING_MESSAGES_SQL)
+
+            # Distribui o envio em lotes para que um servidor SMTP lento ou uma falha
+            # não bloqueiem a notificação dos demais usuários. As mensagens só são
+            # marcadas como notificadas pela subtask, depois que o e-mail é enviado, e
+            # os lotes só são enfileirados se a transação for confirmada.
+            batch = []
+            for email, message_ids in cursor:
+                batch.append((email, message_ids))
+                if len(batch) == NOTIFICATION_BATCH_SIZE:
+                    transaction.on_commit(
+                        partial(send_new_message_notification_emails.delay, batch)
+                    )
+                    batch = []
+
+            if batch:
+                transaction.on_commit(
+                    partial(send_new_message_notification_emails.delay, batch)
+                )
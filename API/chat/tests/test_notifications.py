@@ -1,30 +1,170 @@
-from django.test import TestCase
-from django.core import mail
+from smtplib import SMTPException
+from unittest.mock import patch
+
+import pytest
+from celery.exceptions import Retry
 from django.contrib.auth import get_user_model
-from chat.models import Message, ChatRoom
+from django.core import mail
+from django.test import TestCase
+
+from chat.models import ChatRoom, Message
+from chat.tasks import send_new_message_notification_emails, send_new_message_notifications
 
 User = get_user_model()
 
+
+@patch(
+    "chat.tasks.send_new_message_notification_emails.delay",
+    side_effect=send_new_message_notification_emails,
+)
 class NotificationTest(TestCase):
-    def setUp(self):
-        self.user1 = User.objects.create_user(username="testuser1", email="test1@example.com", password="password123")
-        self.user2 = User.objects.create_user(username="testuser2", email="test2@example.com", password="password123")
-        self.chatroom = ChatRoom.objects.create(participant_1=self.user1, participant_2=self.user2)
+    @classmethod
+    def setUpTestData(cls):
+        cls.user1 = User.objects.create_user(
+            username="testuser1", email="test1@example.com", password="password123"
+        )
+        cls.user2 = User.objects.create_user(
+            username="testuser2", email="test2@example.com", password="password123"
+        )
+        cls.chatroom = ChatRoom.objects.create(
+            participant_1=cls.user1, participant_2=cls.user2
+        )
+
+    def run_notifications(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            send_new_message_notifications()
+
+    def test_email_notification_sent_for_new_messages(self, mock_delay):
+        messages = Message.objects.bulk_create(
+            [
+                Message(room=self.chatroom, sender=self.user2, content="Hello user1!"),
+                Message(room=self.chatroom, sender=self.user2, content="How are you?"),
+            ]
+        )
+
+        self.run_notifications()
+
+        mock_delay.assert_called_once()
+        [(email, message_ids)] = mock_delay.call_args.args[0]
+        assert email == "test1@example.com"
+        assert sorted(message_ids) == sorted(message.id for message in messages)
+        assert len(mail.outbox) == 1
+        assert mail.outbox[0].to == ["test1@example.com"]
+        assert "Você tem novas mensagens (2)" in mail.outbox[0].subject
+        assert "Você tem 2 novas mensagens desde o último aviso." in mail.outbox[0].body
+
+    def test_messages_are_marked_as_notified(self, mock_delay):
+        Message.objects.create(room=self.chatroom, sender=self.user2, content="Hello user1!")
+
+        self.run_notifications()
+        self.run_notifications()
+
+        assert len(mail.outbox) == 1
+        assert not Message.objects.filter(notified=False).exists()
+
+    def test_no_email_sent_if_no_new_messages(self, mock_delay):
+        self.run_notifications()
+
+        mock_delay.assert_not_called()
+        assert len(mail.outbox) == 0
+
+    def test_counts_are_aggregated_per_recipient_across_chatrooms(self, mock_delay):
+        user3 = User.objects.create_user(
+            username="testuser3", email="test3@example.com", password="password123"
+        )
+        other_chatroom = ChatRoom.objects.create(participant_1=user3, participant_2=self.user1)
+        Message.objects.create(room=self.chatroom, sender=self.user2, content="Hello user1!")
+        Message.objects.create(room=self.chatroom, sender=self.user1, content="Hi user2!")
+        Message.objects.create(room=other_chatroom, sender=user3, content="Hello from user3!")
+
+        self.run_notifications()
 
-    def test_email_notification_sent_for_new_messages(self):
+        subjects = {email.to[0]: email.subject for email in mail.outbox}
+        assert len(mail.outbox) == 2
+        assert "Você tem novas mensagens (2)" in subjects["test1@example.com"]
+        assert "Você tem novas mensagens (1)" in subjects["test2@example.com"]
+
+    @patch("chat.tasks.logger")
+    @patch("chat.tasks.EmailMessage.send", side_effect=SMTPException("SMTP indisponível"))
+    def test_failed_email_is_logged(self, mock_send, mock_logger, mock_delay):
+        message = Message.objects.create(
+            room=self.chatroom, sender=self.user2, content="Hello user1!"
+        )
+
+        with pytest.raises(SMTPException):
+            send_new_message_notification_emails([("test1@example.com", [message.id])])
+
+        mock_logger.exception.assert_called_once_with(
+            "Erro ao enviar e-mail para %s", "test1@example.com"
+        )
+        message.refresh_from_db()
+        assert not message.notified
+
+    @patch("chat.tasks.send_new_message_notification_emails.retry", side_effect=Retry)
+    def test_only_failed_recipients_are_retried(self, mock_retry, mock_delay):
+        failed = Message.objects.create(room=self.chatroom, sender=self.user2, content="Oi!")
+        sent = Message.objects.create(room=self.chatroom, sender=self.user1, content="Olá!")
+
+        def send(email_message):
+            if email_message.to == ["test1@example.com"]:
+                raise SMTPException("Destinatário recusado")
+            return 1
+
+        with patch("chat.tasks.EmailMessage.send", autospec=True, side_effect=send):
+            with pytest.raises(Retry):
+                send_new_message_notification_emails(
+                    [("test1@example.com", [failed.id]), ("test2@example.com", [sent.id])]
+                )
+
+        assert mock_retry.call_args.kwargs["args"] == ([("test1@example.com", [failed.id])],)
+        failed.refresh_from_db()
+        sent.refresh_from_db()
+        assert not failed.notified
+        assert sent.notified
+
+    def test_already_notified_messages_are_not_sent_again(self, mock_delay):
+        message = Message.objects.create(
+            room=self.chatroom, sender=self.user2, content="Hello user1!", notified=True
+        )
+
+        send_new_message_notification_emails([("test1@example.com", [message.id])])
+
+        assert len(mail.outbox) == 0
+
+    def test_batches_are_enqueued_only_after_commit(self, mock_delay):
+        Message.objects.create(room=self.chatroom, sender=self.user2, content="Hello user1!")
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            send_new_message_notifications()
+
+        mock_delay.assert_not_called()
+        assert len(callbacks) == 1
+
+        callbacks[0]()
+
+        mock_delay.assert_called_once()
+        assert len(mail.outbox) == 1
+
+    def test_overlapping_runs_send_a_single_email(self, mock_delay):
         Message.objects.create(room=self.chatroom, sender=self.user2, content="Hello user1!")
-        Message.objects.create(room=self.chatroom, sender=self.user2, content="How are you?")
 
-        from chat.tasks import send_new_message_notifications
-        send_new_message_notifications()
+        with self.captureOnCommitCallbacks() as first_run:
+            send_new_message_notifications()
+        with self.captureOnCommitCallbacks() as second_run:
+            send_new_message_notifications()
+
+        for callback in first_run + second_run:
+            callback()
 
-        self.assertEqual(len(mail.outbox), 1)
-        self.assertEqual(mail.outbox[0].to, ["test1@example.com"])
-        self.assertIn("Você tem novas mensagens (2)", mail.outbox[0].subject)
-        self.assertIn("Você tem 2 novas mensagens não lidas.", mail.outbox[0].body)
+        assert mock_delay.call_count == 2
+        assert len(mail.outbox) == 1
+
+    @patch("chat.tasks.NOTIFICATION_BATCH_SIZE", 1)
+    def test_recipients_are_split_into_batches(self, mock_delay):
+        Message.objects.create(room=self.chatroom, sender=self.user2, content="Hello user1!")
+        Message.objects.create(room=self.chatroom, sender=self.user1, content="Hi user2!")
 
-    def test_no_email_sent_if_no_new_messages(self):
-        from chat.tasks import send_new_message_notifications
-        send_new_message_notifications()
+        self.run_notifications()
 
-        self.assertEqual(len(mail.outbox), 0)
+        assert mock_delay.call_count == 2
+        assert len(mail.outbox) == 2
@@ -1,4 +1,6 @@
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase
 
@@ -73,6 +75,29 @@ class ChatRoomViewSetTests(APITestCase):
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert "O item associado não foi encontrado." in str(response.data)
 
+    def create_chat_rooms_with_messages(self, count):
+        start = ChatRoom.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user(username=f"other{i}", password="password")
+            room = ChatRoom.objects.create(
+                participant_1=self.user1, participant_2=user, item=self.item
+            )
+            Message.objects.create(room=room, sender=user, content="Olá!")
+            Message.objects.create(room=room, sender=self.user1, content="Oi!")
+
+    def test_list_chat_rooms_query_count_does_not_grow_with_rooms(self):
+        self.create_chat_rooms_with_messages(2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/chat/chatrooms/")
+        assert response.status_code == status.HTTP_200_OK
+
+        self.create_chat_rooms_with_messages(3)
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get("/api/chat/chatrooms/")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["count"] == 5
+
 
 class MessageViewSetTests(APITestCase):
 
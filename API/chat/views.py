@@ -15,7 +15,9 @@ from .serializers import ChatRoomSerializer, MessageSerializer
 
 
 class ChatRoomViewSet(ModelViewSet):
-    queryset = ChatRoom.objects.all()
+    queryset = ChatRoom.objects.select_related(
+        "participant_1", "participant_2", "item"
+    ).prefetch_related("messages__sender")
     serializer_class = ChatRoomSerializer
     permission_classes = [IsAuthenticated]
 
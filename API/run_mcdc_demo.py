@@ -7,22 +7,23 @@ Este script simula a execução dos testes MC/DC sem depender da configuração
 
 import sys
 import os
+from dataclasses import dataclass, field
 from unittest.mock import Mock, patch, MagicMock
 
 # Simulação das classes Django para demonstração
+@dataclass(slots=True)
 class MockUser:
-    def __init__(self, username='testuser', email='test@example.com', first_name='Test', last_name='User'):
-        self.username = username
-        self.email = email
-        self.first_name = first_name
-        self.last_name = last_name
-        self.pk = 1
+    username: str = 'testuser'
+    email: str = 'test@example.com'
+    first_name: str = 'Test'
+    last_name: str = 'User'
+    pk: int = 1
 
+@dataclass(slots=True)
 class MockUserProfile:
-    def __init__(self, user=None, is_banned=False, pk=None):
-        self.user = user or MockUser()
-        self.is_banned = is_banned
-        self.pk = pk
+    user: MockUser = field(default_factory=MockUser)
+    is_banned: bool = False
+    pk: int | None = None
         
     def save(self):
         if not self.pk:
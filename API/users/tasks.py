@@ -172,6 +172,6 @@ def delete_old_messages(room_id, max_messages=40):
     Mantém apenas as últimas `max_messages` mensagens em uma conversa.
     """
     messages = Message.objects.filter(room_id=room_id).order_by("-timestamp")
-    if messages.count() > max_messages:
+    if messages[max_messages:].exists():
         ids_to_keep = messages.values_list("id", flat=True)[:max_messages]
         Message.objects.filter(room_id=room_id).exclude(id__in=ids_to_keep).delete()
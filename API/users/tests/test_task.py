@@ -6,7 +6,7 @@ from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.utils.timezone import now
 
-from chat.models import ChatRoom
+from chat.models import ChatRoom, Message
 from users.match import (
     find_and_notify_matches,
     generate_match_data,
@@ -16,6 +16,7 @@ from users.match import (
 from users.models import Brand, Category, Color, Item, ItemImage, Location, UserProfile
 from users.tasks import (
     delete_old_items_and_chats,
+    delete_old_messages,
     find_and_notify_matches_task,
     remove_images_from_item,
     send_match_notification,
@@ -185,6 +186,23 @@ class DeleteOldItemsAndChatsTests(TestCase):
 User = get_user_model()
 
 
+class DeleteOldMessagesTests(TestCase):
+    def setUp(self):
+        user1 = User.objects.create_user(username="user1", password="password123")
+        user2 = User.objects.create_user(username="user2", password="password123")
+        self.room = ChatRoom.objects.create(participant_1=user1, participant_2=user2)
+        for i in range(5):
+            Message.objects.create(room=self.room, sender=user1, content=f"Mensagem {i}")
+
+    def test_delete_old_messages_over_limit(self):
+        delete_old_messages(self.room.id, max_messages=3)
+        assert Message.objects.filter(room=self.room).count() == 3
+
+    def test_delete_old_messages_within_limit(self):
+        delete_old_messages(self.room.id, max_messages=5)
+        assert Message.objects.filter(room=self.room).count() == 5
+
+
 class MatchTestCase(TestCase):
     def clean_up(self):
 